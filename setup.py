@@ -9,6 +9,7 @@ setup(
     author='Richard Neumann',
     author_email='mail@richard-neumann.de',
     python_requires='>=3.8',
+    extras_require={'osk': ['PyGObject']},
     packages=['tabletmode'],
     entry_points={
         'console_scripts': [
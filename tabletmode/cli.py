@@ -1,25 +1,41 @@
 """Sets the system mode."""
 
-from argparse import ArgumentParser, Namespace
-from subprocess import DEVNULL
-from subprocess import CalledProcessError
-from subprocess import CompletedProcess
-from subprocess import check_call
-from subprocess import run
-from sys import stderr
-from typing import Optional
+from __future__ import annotations
+
+from functools import lru_cache
+from sys import argv, stderr
+from types import ModuleType
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional
 
 from tabletmode.config import load_config
 
 
+A11Y_APPLICATIONS = 'org.gnome.desktop.a11y.applications'
 DESCRIPTION = 'Sets or toggles the system mode.'
 LAPTOP_MODE_SERVICE = 'laptop-mode.service'
+NOTIFY_FLAGS = {'-n', '--notify'}
+NOTIFY_SEND = '/usr/bin/notify-send'
+STOPPED_STATES = {'inactive', 'failed'}
 TABLET_MODE_SERVICE = 'tablet-mode.service'
 SUDO = '/usr/bin/sudo'
+SYSTEMCTL = '/usr/bin/systemctl'
+
+if TYPE_CHECKING:
+    from subprocess import Popen
+    from gi.repository import Gio
+
+
+class Arguments(NamedTuple):
+    """The CLI arguments."""
 
+    mode: Optional[str]
+    notify: bool
 
-def get_args() -> Namespace:
-    """Returns the CLI arguments."""
+
+def parse_args() -> Arguments:
+    """Parses the CLI arguments with argparse."""
+
+    from argparse import ArgumentParser     # pylint: disable=C0415
 
     parser = ArgumentParser(description=DESCRIPTION)
     parser.add_argument(
@@ -30,50 +46,120 @@ def get_args() -> Namespace:
     subparsers.add_parser('laptop', help='switch to laptop mode')
     subparsers.add_parser('tablet', help='switch to tablet mode')
     subparsers.add_parser('default', help='do not disable any input devices')
-    return parser.parse_args()
+    args = parser.parse_args()
+    return Arguments(args.mode, args.notify)
+
+
+def get_args() -> Arguments:
+    """Returns the CLI arguments.
+
+    The usual invocations are read from argv directly to spare the
+    argparse import and setup. Anything else, including --help and
+    invalid arguments, is handed to argparse.
+    """
+
+    args = argv[1:]
+    mode = args.pop() if args and args[-1] in HANDLERS else None
+
+    if all(arg in NOTIFY_FLAGS for arg in args):
+        return Arguments(mode, bool(args))
+
+    return parse_args()
+
 
+def systemctl(action: str, *units: str, sudo: str = SUDO) -> Popen:
+    """Starts systemctl as root on the given units.
 
-def systemctl(action: str, unit: str, *, root: bool = False,
-              sudo: str = SUDO) -> bool:
-    """Runs systemctl."""
+    The command keeps the bare program name, so that it matches rules
+    of the configured sudo program, such as doas's cmd.
+    """
 
-    command = [sudo] if root else []
-    command += ['systemctl', action, unit]
+    from subprocess import DEVNULL, Popen   # pylint: disable=C0415,W0621
+
+    command = [sudo, 'systemctl', action, *units]
+    # Allow posix_spawn(). Inherited inheritable descriptors stay open.
+    return Popen(command, stdout=DEVNULL, close_fds=False)
+
+
+def get_active_states(*units: str) -> Dict[str, str]:
+    """Returns the active states of the given units."""
+
+    from subprocess import DEVNULL, PIPE, run   # pylint: disable=C0415
+
+    # Allow posix_spawn(). Inherited inheritable descriptors stay open.
+    result = run(
+        [SYSTEMCTL, 'show', '--property=ActiveState', '--value', *units],
+        stdout=PIPE, stderr=DEVNULL, close_fds=False, text=True, check=False)
+    return dict(zip(units, result.stdout.split()))
+
+
+def import_gio() -> ModuleType:
+    """Imports and returns the Gio module."""
+
+    # pylint: disable=C0415
+    from gi import require_version
+    require_version('Gio', '2.0')
+    from gi.repository import Gio   # pylint: disable=W0621
+    return Gio
+
+
+@lru_cache(maxsize=1)
+def get_a11y_settings() -> Optional[Gio.Settings]:
+    """Returns the accessibility applications settings if available."""
 
     try:
-        check_call(command, stdout=DEVNULL)     # Return 0 on success.
-    except CalledProcessError:
-        return False
+        gio = import_gio()
+    except (ImportError, ValueError):
+        return None
+
+    # Gio.Settings.new() aborts the process if the schema is not installed.
+    source = gio.SettingsSchemaSource.get_default()
+
+    if source is None or source.lookup(A11Y_APPLICATIONS, True) is None:
+        return None
+
+    return gio.Settings.new(A11Y_APPLICATIONS)
 
-    return True
 
 def set_osk_state(state: bool) -> bool:
-    command = ['/usr/bin/gsettings', 'set', 'org.gnome.desktop.a11y.applications', 'screen-keyboard-enabled', str(state).lower()]
-    try:
-        check_call(command, stdout=DEVNULL)
-    except CalledProcessError:
+    """Enables or disables the on-screen keyboard."""
+
+    if (settings := get_a11y_settings()) is None:
         return False
-    
-    return True
 
-def notify_send(summary: str, body: Optional[str] = None) -> CompletedProcess:
-    """Sends the respective message."""
+    result = settings.set_boolean('screen-keyboard-enabled', state)
+    import_gio().Settings.sync()    # Flush the write before the process exits.
+    return result
+
+
+def wait(*processes: Popen) -> bool:
+    """Waits for all processes and returns whether they succeeded."""
 
-    command = ['/usr/bin/notify-send', summary]
+    returncodes = [process.wait() for process in processes]
+    return all(returncode == 0 for returncode in returncodes)
+
+
+def notify_send(summary: str, body: Optional[str] = None) -> Popen:
+    """Sends the respective message without waiting for it."""
+
+    from subprocess import DEVNULL, Popen   # pylint: disable=C0415,W0621
+
+    command = [NOTIFY_SEND, summary]
 
     if body is not None:
         command.append(body)
 
-    return run(command, stdout=DEVNULL, check=False)
+    return Popen(
+        command, stdout=DEVNULL, stderr=DEVNULL, start_new_session=True)
 
 
-def notify_laptop_mode() -> CompletedProcess:
+def notify_laptop_mode() -> Popen:
     """Notifies about laptop mode."""
 
     return notify_send('Laptop mode.', 'The system is now in laptop mode.')
 
 
-def notify_tablet_mode() -> CompletedProcess:
+def notify_tablet_mode() -> Popen:
     """Notifies about tablet mode."""
 
     return notify_send('Tablet mode.', 'The system is now in tablet mode.')
@@ -82,32 +168,54 @@ def notify_tablet_mode() -> CompletedProcess:
 def default_mode(notify: bool = False, *, sudo: str = SUDO) -> None:
     """Restores all blocked input devices."""
 
-    systemctl('stop', LAPTOP_MODE_SERVICE, root=True, sudo=sudo)
-    systemctl('stop', TABLET_MODE_SERVICE, root=True, sudo=sudo)
+    states = get_active_states(LAPTOP_MODE_SERVICE, TABLET_MODE_SERVICE)
+    units = [
+        unit for unit in (LAPTOP_MODE_SERVICE, TABLET_MODE_SERVICE)
+        if states.get(unit) not in STOPPED_STATES
+    ]
+
+    processes = []
+
+    if units:
+        processes.append(systemctl('stop', *units, sudo=sudo))
+
     set_osk_state(False)
 
+    if not wait(*processes):
+        print('Could not stop the mode services.', file=stderr, flush=True)
+
     if notify:
         notify_send('Default mode.', 'The system is now in default mode.')
 
 
 def laptop_mode(notify: bool = False, *, sudo: str = SUDO) -> None:
-    """Starts the laptop mode."""
+    """Starts the laptop mode.
+
+    The mode units conflict with each other, so systemd queues a stop job
+    for the tablet mode unit in the same transaction. Their ordering
+    dependency makes the stop complete before the start, so the devices
+    are released before they are grabbed again.
+    """
 
-    systemctl('stop', TABLET_MODE_SERVICE, root=True, sudo=sudo)
-    systemctl('start', LAPTOP_MODE_SERVICE, root=True, sudo=sudo)
+    process = systemctl('start', LAPTOP_MODE_SERVICE, sudo=sudo)
     set_osk_state(False)
 
+    if not wait(process):
+        print('Could not start laptop mode.', file=stderr, flush=True)
+
     if notify:
         notify_laptop_mode()
 
 
 def tablet_mode(notify: bool = False, *, sudo: str = SUDO) -> None:
-    """Starts the tablet mode."""
+    """Starts the tablet mode, implicitly stopping the laptop mode."""
 
-    systemctl('stop', LAPTOP_MODE_SERVICE, root=True, sudo=sudo)
-    systemctl('start', TABLET_MODE_SERVICE, root=True, sudo=sudo)
+    process = systemctl('start', TABLET_MODE_SERVICE, sudo=sudo)
     set_osk_state(True)
 
+    if not wait(process):
+        print('Could not start tablet mode.', file=stderr, flush=True)
+
     if notify:
         notify_tablet_mode()
 
@@ -115,12 +223,22 @@ def tablet_mode(notify: bool = False, *, sudo: str = SUDO) -> None:
 def toggle_mode(notify: bool = False, *, sudo: str = SUDO) -> None:
     """Toggles between laptop and tablet mode."""
 
-    if systemctl('status', TABLET_MODE_SERVICE):
+    states = get_active_states(TABLET_MODE_SERVICE)
+
+    if states.get(TABLET_MODE_SERVICE) == 'active':
         laptop_mode(notify=notify, sudo=sudo)
     else:
         tablet_mode(notify=notify, sudo=sudo)
 
 
+HANDLERS = {
+    'toggle': toggle_mode,
+    'laptop': laptop_mode,
+    'tablet': tablet_mode,
+    'default': default_mode
+}
+
+
 def main() -> None:
     """Runs the main program."""
 
@@ -129,13 +247,7 @@ def main() -> None:
     notify = config.get('notify', False) or args.notify
     sudo = config.get('sudo', SUDO)
 
-    if args.mode == 'toggle':
-        toggle_mode(notify=notify, sudo=sudo)
-    elif args.mode == 'default':
-        default_mode(notify=notify, sudo=sudo)
-    elif args.mode == 'laptop':
-        laptop_mode(notify=notify, sudo=sudo)
-    elif args.mode == 'tablet':
-        tablet_mode(notify=notify, sudo=sudo)
-    else:
+    if args.mode is None:
         print('Must specify a mode.', file=stderr, flush=True)
+    else:
+        HANDLERS[args.mode](notify=notify, sudo=sudo)
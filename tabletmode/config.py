@@ -1,5 +1,6 @@
 """Configuration file parsing."""
 
+from functools import lru_cache
 from json import load
 from logging import getLogger
 from pathlib import Path
@@ -12,8 +13,12 @@ CONFIG_FILE = Path('/etc/tablet-mode.json')
 LOGGER = getLogger('tabletmode')
 
 
+@lru_cache(maxsize=1)
 def load_config() -> dict:
-    """Returns the configuration."""
+    """Returns the configuration.
+
+    The file is only read and parsed once per process.
+    """
 
     try:
         with CONFIG_FILE.open('r') as cfg:
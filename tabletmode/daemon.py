@@ -1,21 +1,34 @@
 """System mode daemon."""
 
-from argparse import ArgumentParser, Namespace
+from fcntl import ioctl
 from logging import DEBUG, INFO, basicConfig, getLogger
-from subprocess import Popen
-from typing import Iterable
+from os import O_RDONLY, close, open as open_fd
+from signal import pause
+from sys import argv
+from typing import Iterable, NamedTuple, Optional
 
 from tabletmode.config import load_config
 
 
 DESCRIPTION = 'Setup system for laptop or tablet mode.'
-EVTEST = '/usr/bin/evtest'
+EVIOCGRAB = 0x40044590     # _IOW('E', 0x90, int) from <linux/input.h>
 LOG_FORMAT = '[%(levelname)s] %(name)s: %(message)s'
 LOGGER = getLogger('sysmoded')
+MODES = {'laptop', 'tablet'}
+VERBOSE_FLAGS = {'-v', '--verbose'}
 
 
-def get_args() -> Namespace:
-    """Parses the CLI arguments."""
+class Arguments(NamedTuple):
+    """The CLI arguments."""
+
+    mode: Optional[str]
+    verbose: bool
+
+
+def parse_args() -> Arguments:
+    """Parses the CLI arguments with argparse."""
+
+    from argparse import ArgumentParser     # pylint: disable=C0415
 
     parser = ArgumentParser(description=DESCRIPTION)
     parser.add_argument(
@@ -24,32 +37,62 @@ def get_args() -> Namespace:
     subparsers = parser.add_subparsers(dest='mode')
     subparsers.add_parser('laptop', help='enable laptop mode')
     subparsers.add_parser('tablet', help='enable tablet mode')
-    return parser.parse_args()
+    args = parser.parse_args()
+    return Arguments(args.mode, args.verbose)
 
 
-def disable_device(device: str) -> Popen:
-    """Disables the respective device via evtest."""
+def get_args() -> Arguments:
+    """Returns the CLI arguments.
 
-    return Popen((EVTEST, '--grab', device))
+    The invocations used by the systemd units are read from argv
+    directly. Anything else is handed to argparse.
+    """
 
+    args = argv[1:]
+    mode = args.pop() if args and args[-1] in MODES else None
 
-def disable_devices(devices: Iterable[str]) -> None:
-    """Disables the given devices."""
+    if all(arg in VERBOSE_FLAGS for arg in args):
+        return Arguments(mode, bool(args))
 
-    subprocesses = []
+    return parse_args()
 
-    for device in devices:
-        subprocess = disable_device(device)
-        subprocesses.append(subprocess)
 
-    for subprocess in subprocesses:
-        subprocess.wait()
+def disable_device(device: str) -> Optional[int]:
+    """Disables the respective device by grabbing it exclusively.
 
+    Returns the file descriptor holding the grab. The grab is released
+    when the descriptor is closed, i.e. when the process terminates.
+    """
 
-def get_devices(mode: str) -> Iterable[str]:
-    """Reads the device from the config file."""
+    try:
+        fd = open_fd(device, O_RDONLY)
+    except OSError as error:
+        LOGGER.error('Cannot open device %s: %s', device, error)
+        return None
+
+    try:
+        ioctl(fd, EVIOCGRAB, 1)
+    except OSError as error:
+        LOGGER.error('Cannot grab device %s: %s', device, error)
+        close(fd)
+        return None
+
+    LOGGER.debug('Disabled device %s.', device)
+    return fd
+
+
+def disable_devices(devices: Iterable[str]) -> None:
+    """Disables the given devices until the process is terminated."""
+
+    fds = [fd for fd in map(disable_device, devices) if fd is not None]
+
+    if fds:
+        pause()
+
+
+def get_devices(config: dict, mode: str) -> Iterable[str]:
+    """Returns the devices to disable in the given mode."""
 
-    config = load_config()
     devices = config.get(mode) or ()
 
     if not devices:
@@ -64,5 +107,6 @@ def main():
     arguments = get_args()
     level = DEBUG if arguments.verbose else INFO
     basicConfig(level=level, format=LOG_FORMAT)
-    devices = get_devices(arguments.mode)
+    config = load_config()
+    devices = get_devices(config, arguments.mode)
     disable_devices(devices)